@@ -0,0 +1,34 @@
+"""
+Configuración de gunicorn para el despliegue en Azure.
+
+gunicorn lee este archivo automáticamente al iniciarse desde la raíz del proyecto.
+"""
+
+import os
+
+# Un hilo de OpenMP/MKL por worker; se define antes de que se importe PyTorch.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+# Workers con hilos: cada worker atiende varias peticiones a la vez, de modo que el
+# hilo de lotes de myapp.views puede juntar predicciones concurrentes en una sola pasada.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Carga la aplicación de Django en el proceso maestro antes de crear los workers.
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Carga el modelo ALBERT en el proceso maestro antes de crear los workers.
+
+    Los workers se crean con `fork` y heredan las páginas de memoria del modelo
+    (copy-on-write), por lo que los pesos se cargan una sola vez y se comparten.
+    Solo se hace en CPU: CUDA no puede volver a inicializarse en un proceso creado
+    con `fork`, así que en GPU cada worker carga el modelo con su primera predicción.
+    """
+    from myapp.views import cargar_modelo, device
+
+    if device.type == "cpu":
+        cargar_modelo()
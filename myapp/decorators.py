@@ -0,0 +1,28 @@
+from functools import wraps
+
+from django.shortcuts import redirect
+
+
+def require_session_user(view_func):
+    """
+    Decorador que exige un usuario autenticado en la sesión.
+
+    Lee `authenticated_user` de la sesión y, si no existe, redirige al login.
+
+    Parámetros:
+    -----------
+    view_func : callable
+        Vista de Django a proteger.
+
+    Retorna:
+    --------
+    callable
+        Vista envuelta que redirige a `login` si el usuario no está autenticado.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not request.session.get("authenticated_user"):
+            return redirect("login")  # Redirigir al login si no está autenticado
+        return view_func(request, *args, **kwargs)
+
+    return _wrapped_view
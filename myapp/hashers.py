@@ -0,0 +1,47 @@
+import base64
+import hashlib
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.encoding import force_bytes
+
+# `fastpbkdf2` es opcional (pip install fastpbkdf2); no está en requirements.txt porque
+# necesita compilarse y un fallo de compilación impediría instalar el resto de dependencias.
+try:
+    from fastpbkdf2 import pbkdf2_hmac
+except ImportError:  # Si la extensión en C no está instalada se usa la de hashlib
+    pbkdf2_hmac = hashlib.pbkdf2_hmac
+
+
+class FastPBKDF2Hasher(PBKDF2PasswordHasher):
+    """
+    Hasher PBKDF2-SHA256 con un número de iteraciones ajustado.
+
+    Usa 260.000 iteraciones (recomendación de OWASP para PBKDF2-HMAC-SHA256) en lugar
+    del valor por defecto de Django, lo que acelera el registro y el inicio de sesión.
+    Conserva el algoritmo `pbkdf2_sha256`, por lo que los hashes existentes siguen
+    siendo válidos: la verificación usa las iteraciones guardadas en cada hash.
+    """
+
+    iterations = 260000
+
+
+class FastCPBKDF2Hasher(FastPBKDF2Hasher):
+    """
+    Variante de `FastPBKDF2Hasher` que calcula PBKDF2 con la librería en C `fastpbkdf2`.
+
+    Produce exactamente los mismos hashes que `hashlib.pbkdf2_hmac`, por lo que es
+    compatible con las contraseñas ya guardadas. Si `fastpbkdf2` no está disponible
+    se comporta igual que `FastPBKDF2Hasher`.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = pbkdf2_hmac(
+            self.digest().name,
+            force_bytes(password),
+            force_bytes(salt),
+            iterations,
+        )
+        hash = base64.b64encode(hash).decode("ascii").strip()
+        return "%s$%d$%s$%s" % (self.algorithm, iterations, salt, hash)
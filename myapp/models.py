@@ -1,6 +1,26 @@
-import random
+import secrets
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+# Prefijos de las contraseñas que ya están encriptadas
+_HASHED_PASSWORD_PREFIXES = ('pbkdf2_sha256$',)
+
+# Tiempo de validez (en segundos) de los códigos de verificación, igual al indicado en el correo
+VERIFICATION_CODE_TTL = 600
+
+def set_code(user_id, code):
+    """Guarda en cache el código de verificación del usuario durante `VERIFICATION_CODE_TTL` segundos."""
+    cache.set(f"vcode:{user_id}", code, VERIFICATION_CODE_TTL)
+
+def get_code(user_id):
+    """Devuelve el código de verificación vigente del usuario, o `None` si expiró."""
+    return cache.get(f"vcode:{user_id}")
+
+def delete_code(user_id):
+    """Elimina el código de verificación del usuario para que no pueda reutilizarse."""
+    cache.delete(f"vcode:{user_id}")
 
 class AppUser(models.Model):
     first_name = models.CharField(max_length=100)
@@ -9,17 +29,42 @@ class AppUser(models.Model):
     password = models.CharField(max_length=255)  # Guardada encriptada
     verification_code = models.CharField(max_length=6, blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recuerda la contraseña leída de la base de datos, que ya está encriptada."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_password = instance.__dict__.get('password')
+        return instance
+
     def save(self, *args, **kwargs):
         """Hashea la contraseña antes de guardar el usuario."""
-        if not self.password.startswith('pbkdf2_sha256$'):
-            self.password = make_password(self.password)
+        password = self.password
+        if password is not getattr(self, '_loaded_password', None) and not password.startswith(_HASHED_PASSWORD_PREFIXES):
+            self.password = make_password(password)
         super().save(*args, **kwargs)
+        self._loaded_password = self.password
 
     def check_password(self, raw_password):
-        """Verifica si la contraseña ingresada es correcta."""
-        return check_password(raw_password, self.password)
+        """
+        Verifica si la contraseña ingresada es correcta.
+
+        Si el hash guardado usa otros parámetros (por ejemplo, más iteraciones de PBKDF2),
+        se vuelve a encriptar con el hasher actual actualizando solo la columna `password`.
+        """
+        def setter(raw_password):
+            self.password = make_password(raw_password)
+            AppUser.objects.filter(pk=self.pk).update(password=self.password)
+            self._loaded_password = self.password
+
+        return check_password(raw_password, self.password, setter)
 
     def generate_verification_code(self):
-        """Genera un código de 6 dígitos y lo guarda en el modelo"""
-        self.verification_code = str(random.randint(100000, 999999))
-        self.save()
\ No newline at end of file
+        """Genera un código de 6 dígitos, lo guarda en cache y lo devuelve"""
+        code = f"{secrets.randbelow(900000) + 100000:06d}"
+        set_code(self.pk, code)
+        return code
+
+    def check_verification_code(self, code):
+        """Verifica si el código ingresado coincide con el código vigente del usuario."""
+        stored_code = get_code(self.pk)
+        return bool(stored_code and code) and constant_time_compare(stored_code, code)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import smtplib
+
+from celery import shared_task
+from django.core.mail import get_connection, send_mail
+
+# Plantillas de los correos, creadas una sola vez al importar el módulo
+LOGIN_EMAIL_TMPL = """Hola {first_name}.
+
+Hemos recibido una solicitud para acceder a tu cuenta en NEX.
+Para completar el inicio de sesión, ingresa el siguiente código de verificación:
+
+🔑 {code}
+
+Este código es válido por 10 minutos. Si no solicitaste este acceso, puedes ignorar este mensaje.
+
+Si necesitas ayuda, contáctanos en cancerproyecto0@gmail.com.
+
+Saludos,
+El equipo de NEX
+"""
+
+RESET_EMAIL_TMPL = """Hola {first_name},
+
+Has solicitado restablecer tu contraseña en NEX.
+Usa el siguiente código para continuar con el proceso:
+
+🔑 {code}
+
+Si no solicitaste esto, ignora este mensaje.
+
+Saludos,
+El equipo de NEX
+"""
+
+EMAIL_TEMPLATES = {
+    "login": LOGIN_EMAIL_TMPL,
+    "reset": RESET_EMAIL_TMPL,
+}
+
+
+# Los errores de SMTP o de red se reintentan con espera exponencial para que el código llegue al usuario
+@shared_task(autoretry_for=(smtplib.SMTPException, OSError), retry_backoff=True, max_retries=3)
+def send_verification_email(email, first_name, code, subject, template):
+    """
+    Tarea de Celery que envía por correo el código de verificación de un usuario.
+
+    Se ejecuta en un worker de Celery para que las vistas no queden bloqueadas
+    esperando la conexión SMTP. Si el envío falla por SMTP o por la red, se
+    reintenta hasta 3 veces.
+
+    Parámetros:
+    -----------
+    email : str
+        Correo electrónico del destinatario.
+    first_name : str
+        Nombre del usuario, utilizado en el saludo.
+    code : str
+        Código de verificación de 6 dígitos.
+    subject : str
+        Asunto del correo.
+    template : str
+        Tipo de mensaje a enviar: `"login"` para el inicio de sesión o
+        `"reset"` para la recuperación de contraseña.
+    """
+    if template not in EMAIL_TEMPLATES:
+        raise ValueError(f"Plantilla de correo desconocida: {template}")
+    message = EMAIL_TEMPLATES[template].format_map({"first_name": first_name, "code": code})
+
+    send_mail(
+        subject,
+        message,
+        email,
+        [email],
+        fail_silently=False,
+        connection=get_connection(),
+    )
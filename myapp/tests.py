@@ -1,3 +1,426 @@
-from django.test import TestCase
+import base64
+import copy
+import hashlib
+import os
+import smtplib
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import torch
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.core import mail
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from transformers import AlbertConfig, AlbertForSequenceClassification
+
+from . import views
+from .hashers import FastCPBKDF2Hasher
+from .models import VERIFICATION_CODE_TTL, AppUser, delete_code, get_code, set_code
+from .tasks import send_verification_email
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class SendVerificationEmailTests(SimpleTestCase):
+    """Pruebas de la tarea de Celery que envía el código por correo."""
+
+    def test_renders_each_template(self):
+        for template, expected in (("login", "acceder a tu cuenta"), ("reset", "restablecer tu contraseña")):
+            with self.subTest(template=template):
+                mail.outbox = []
+                result = send_verification_email.apply(
+                    args=("ana@example.com", "Ana", "123456", "Asunto", template)
+                )
+
+                self.assertTrue(result.successful())
+                self.assertEqual(len(mail.outbox), 1)
+                self.assertEqual(mail.outbox[0].to, ["ana@example.com"])
+                self.assertEqual(mail.outbox[0].subject, "Asunto")
+                self.assertIn("Hola Ana", mail.outbox[0].body)
+                self.assertIn("🔑 123456", mail.outbox[0].body)
+                self.assertIn(expected, mail.outbox[0].body)
+
+    def test_unknown_template_is_rejected(self):
+        with mock.patch("myapp.tasks.send_mail") as send_mail:
+            with self.assertRaises(ValueError):
+                send_verification_email("ana@example.com", "Ana", "123456", "Asunto", "otra")
+        send_mail.assert_not_called()
+
+    def test_smtp_errors_are_retried(self):
+        with mock.patch("myapp.tasks.send_mail", side_effect=[smtplib.SMTPException("caído"), 1]) as send_mail:
+            result = send_verification_email.apply(
+                args=("ana@example.com", "Ana", "123456", "Asunto", "login")
+            )
+
+        self.assertTrue(result.successful())
+        self.assertEqual(send_mail.call_count, 2)
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch("myapp.tasks.send_mail", side_effect=OSError("sin red")) as send_mail:
+            result = send_verification_email.apply(
+                args=("ana@example.com", "Ana", "123456", "Asunto", "login")
+            )
+
+        self.assertTrue(result.failed())
+        self.assertEqual(send_mail.call_count, 1 + send_verification_email.max_retries)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VerificationCodeTests(TestCase):
+    """Pruebas del código de verificación guardado en cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = AppUser.objects.create(
+            first_name="Ana", last_name="Pérez", email="ana@example.com", password=make_password("secreta")
+        )
+        patcher = mock.patch("myapp.views.send_verification_email")
+        self.send_email = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self):
+        """Inicia sesión y devuelve el código enviado por correo."""
+        response = self.client.post(reverse("login"), {"email": "ana@example.com", "password": "secreta"})
+        self.assertRedirects(response, reverse("verify_code"), fetch_redirect_response=False)
+        return self.send_email.delay.call_args.args[2]
+
+    def test_set_get_delete_code(self):
+        set_code(self.user.id, "123456")
+        self.assertEqual(get_code(self.user.id), "123456")
+        self.assertTrue(self.user.check_verification_code("123456"))
+        self.assertFalse(self.user.check_verification_code("654321"))
+        delete_code(self.user.id)
+        self.assertIsNone(get_code(self.user.id))
+        self.assertFalse(self.user.check_verification_code("123456"))
+
+    def test_generated_code_is_not_stored_in_db(self):
+        code = self.user.generate_verification_code()
+        self.assertRegex(code, r"^\d{6}$")
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.verification_code)
+
+    def test_login_code_works_only_once(self):
+        code = self.login()
+        self.send_email.delay.assert_called_once_with(
+            "ana@example.com", "Ana", code, mock.ANY, "login"
+        )
+
+        response = self.client.post(reverse("verify_code"), {"code": code})
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        self.assertEqual(self.client.session["authenticated_user"], "ana@example.com")
+
+        response = self.client.post(reverse("verify_code"), {"code": code})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["error"], "Código incorrecto.")
+
+    def test_wrong_code_is_rejected(self):
+        code = self.login()
+        wrong_code = "000000" if code != "000000" else "111111"
+
+        response = self.client.post(reverse("verify_code"), {"code": wrong_code})
+        self.assertEqual(response.context["error"], "Código incorrecto.")
+        self.assertNotIn("authenticated_user", self.client.session)
+
+    def test_expired_code_is_rejected(self):
+        code = self.login()
+
+        expired = time.time() + VERIFICATION_CODE_TTL + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=expired):
+            self.assertIsNone(get_code(self.user.id))
+        response = self.client.post(reverse("verify_code"), {"code": code})
+        self.assertEqual(response.context["error"], "Código incorrecto.")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PasswordTests(TestCase):
+    """Pruebas de la verificación de contraseñas en el inicio de sesión."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = AppUser.objects.create(
+            first_name="Ana", last_name="Pérez", email="ana@example.com", password=make_password("secreta")
+        )
+
+    def test_make_password_uses_fast_hasher(self):
+        encoded = make_password("secreta")
+        hasher = identify_hasher(encoded)
+        self.assertIsInstance(hasher, FastCPBKDF2Hasher)
+        self.assertEqual(hasher.safe_summary(encoded)["iterations"], FastCPBKDF2Hasher.iterations)
+        self.assertTrue(check_password("secreta", encoded))
+        self.assertFalse(check_password("otra", encoded))
+
+    def test_legacy_hash_is_verified_and_rehashed(self):
+        salt = "saltsaltsalt"
+        digest = hashlib.pbkdf2_hmac("sha256", b"secreta", salt.encode(), 1000)
+        legacy = f"pbkdf2_sha256$1000${salt}${base64.b64encode(digest).decode()}"
+        AppUser.objects.filter(pk=self.user.pk).update(password=legacy)
+        user = AppUser.objects.get(pk=self.user.pk)
+
+        self.assertIsInstance(identify_hasher(legacy), FastCPBKDF2Hasher)
+        self.assertTrue(user.check_password("secreta"))
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith(f"pbkdf2_sha256${FastCPBKDF2Hasher.iterations}$"))
+        self.assertTrue(user.check_password("secreta"))
+
+    def test_reset_password_writes_verifiable_hash(self):
+        self.assertTrue(views._check_password_cached(self.user, "secreta"))
+
+        with mock.patch("myapp.views.send_verification_email") as send_email:
+            self.client.post(reverse("forgot_password"), {"email": "ana@example.com"})
+            code = send_email.delay.call_args.args[2]
+        self.client.post(reverse("verify_reset_code"), {"code": code})
+        response = self.client.post(reverse("reset_password"), {"password": "nueva-secreta"})
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+        self.assertNotIn("reset_email", self.client.session)
+        self.assertNotIn("verified_reset", self.client.session)
+
+        user = AppUser.objects.get(pk=self.user.pk)
+        self.assertIsInstance(identify_hasher(user.password), FastCPBKDF2Hasher)
+        self.assertTrue(check_password("nueva-secreta", user.password))
+        # La huella guardada con la contraseña anterior deja de servir
+        self.assertFalse(views._check_password_cached(user, "secreta"))
+        self.assertTrue(views._check_password_cached(user, "nueva-secreta"))
+
+    def test_unknown_email_still_runs_pbkdf2(self):
+        with mock.patch("myapp.views.check_password", wraps=check_password) as check:
+            response = self.client.post(reverse("login"), {"email": "nadie@example.com", "password": "secreta"})
+
+        self.assertEqual(response.context["error"], "Correo no registrado.")
+        check.assert_called_once_with("secreta", views._dummy_hash())
+        self.assertIsInstance(identify_hasher(views._dummy_hash()), FastCPBKDF2Hasher)
+
+    def test_cached_password_skips_pbkdf2(self):
+        self.assertTrue(views._check_password_cached(self.user, "secreta"))
+
+        with mock.patch.object(AppUser, "check_password") as check:
+            self.assertTrue(views._check_password_cached(self.user, "secreta"))
+            check.assert_not_called()
+
+            check.return_value = False
+            self.assertFalse(views._check_password_cached(self.user, "otra"))
+            check.assert_called_once_with("otra")
+
+    def test_wrong_password_is_not_cached(self):
+        self.assertFalse(views._check_password_cached(self.user, "otra"))
+        self.assertIsNone(cache.get(f"pwfast:{self.user.id}"))
+
+    def test_fast_key_depends_on_secret_key_and_stored_hash(self):
+        fast_key = views._password_fast_key(self.user, "secreta")
+
+        with override_settings(SECRET_KEY="otra-clave-secreta"):
+            self.assertNotEqual(views._password_fast_key(self.user, "secreta"), fast_key)
+
+        self.user.password = make_password("secreta")
+        self.assertNotEqual(views._password_fast_key(self.user, "secreta"), fast_key)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequireSessionUserTests(TestCase):
+    """Pruebas del decorador `require_session_user`."""
+
+    def test_redirects_without_authenticated_user(self):
+        for name in ("home", "historia_clinica", "hacer_prediccion"):
+            response = self.client.get(reverse(name))
+            self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+
+    def test_renders_with_authenticated_user(self):
+        session = self.client.session
+        session["authenticated_user"] = "ana@example.com"
+        session.save()
+
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PrediccionCacheTests(SimpleTestCase):
+    """Pruebas de la cache de resultados de `predecir_con_modelo_entrenado`."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("myapp.views.cargar_modelo", return_value=(object(), object()))
+        self.cargar_modelo = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "myapp.views._predecir_lote", side_effect=lambda textos: [views.ETIQUETAS[1]] * len(textos)
+        )
+        self.predecir_lote = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_hit_skips_queue(self):
+        self.assertEqual(views.predecir_con_modelo_entrenado("Texto clínico"), views.ETIQUETAS[1])
+        self.predecir_lote.reset_mock()
+        self.cargar_modelo.reset_mock()
+
+        with mock.patch.object(views._cola_predicciones, "put") as put:
+            etiqueta = views.predecir_con_modelo_entrenado("  texto CLÍNICO ")
+
+        self.assertEqual(etiqueta, views.ETIQUETAS[1])
+        put.assert_not_called()
+        self.cargar_modelo.assert_not_called()
+        self.predecir_lote.assert_not_called()
+
+    def test_errors_are_not_cached(self):
+        self.cargar_modelo.return_value = (None, None)
+        self.assertTrue(views.predecir_con_modelo_entrenado("Texto sin modelo").startswith("Error"))
+
+        self.cargar_modelo.return_value = (object(), object())
+        self.predecir_lote.side_effect = RuntimeError("fallo")
+        self.assertTrue(views.predecir_con_modelo_entrenado("Texto con fallo").startswith("Error"))
+
+        self.predecir_lote.side_effect = lambda textos: [views.ETIQUETAS[0]] * len(textos)
+        self.assertEqual(views.predecir_con_modelo_entrenado("Texto sin modelo"), views.ETIQUETAS[0])
+        self.assertEqual(views.predecir_con_modelo_entrenado("Texto con fallo"), views.ETIQUETAS[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProcesadorLotesTests(SimpleTestCase):
+    """Pruebas del hilo que agrupa las predicciones concurrentes en lotes."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("myapp.views.cargar_modelo", return_value=(object(), object()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Ventana amplia para que las peticiones de la prueba caigan en el mismo lote
+        patcher = mock.patch("myapp.views.VENTANA_LOTE", 0.5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def predecir_en_paralelo(self, textos):
+        """Lanza una predicción por texto en hilos distintos y devuelve los resultados."""
+        resultados = {}
+
+        def predecir(texto):
+            resultados[texto] = views.predecir_con_modelo_entrenado(texto)
+
+        hilos = [threading.Thread(target=predecir, args=(texto,)) for texto in textos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados
+
+    def test_concurrent_callers_share_one_batch(self):
+        def predecir_lote(textos):
+            return [views.ETIQUETAS[1] if "crc" in texto else views.ETIQUETAS[0] for texto in textos]
+
+        textos = ["lote crc 1", "lote sano 2", "lote crc 3", "lote sano 4"]
+        with mock.patch("myapp.views._predecir_lote", side_effect=predecir_lote) as stub:
+            resultados = self.predecir_en_paralelo(textos)
+
+        stub.assert_called_once()
+        self.assertCountEqual(stub.call_args.args[0], textos)
+        self.assertEqual(resultados, {texto: predecir_lote([texto])[0] for texto in textos})
+
+    def test_batch_error_releases_every_waiter(self):
+        textos = ["error 1", "error 2", "error 3"]
+        with mock.patch("myapp.views._predecir_lote", side_effect=RuntimeError("fallo")) as stub:
+            resultados = self.predecir_en_paralelo(textos)
+
+        stub.assert_called_once()
+        self.assertEqual(resultados, dict.fromkeys(textos, "Error: No se pudo realizar la predicción."))
+
+    def test_slow_batch_times_out(self):
+        liberar = threading.Event()
+
+        def predecir_lote(textos):
+            liberar.wait()
+            return [views.ETIQUETAS[0]] * len(textos)
+
+        patcher = mock.patch("myapp.views._predecir_lote", side_effect=predecir_lote)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(liberar.set)
+
+        with mock.patch("myapp.views.TIEMPO_MAXIMO_ESPERA", 0.1):
+            etiqueta = views.predecir_con_modelo_entrenado("texto lento")
+
+        self.assertEqual(etiqueta, "Error: La predicción tardó demasiado. Intenta de nuevo.")
+        self.assertIsNone(cache.get("pred:" + hashlib.sha256(b"texto lento").hexdigest()))
+
+
+class GuardarTokenizerRapidoTests(SimpleTestCase):
+    """Pruebas de la escritura de `tokenizer.json` en la carpeta del modelo."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        patcher = mock.patch("myapp.views.DIRECTORIO_MODELO", self.directorio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tokenizer = mock.Mock()
+
+    def test_writes_tokenizer_json(self):
+        def save(ruta):
+            with open(ruta, "w") as f:
+                f.write("{}")
+
+        self.tokenizer.backend_tokenizer.save.side_effect = save
+        views.guardar_tokenizer_rapido(self.tokenizer)
+
+        # Se escribe en un archivo temporal que después se renombra
+        ruta_escrita = self.tokenizer.backend_tokenizer.save.call_args.args[0]
+        self.assertNotEqual(ruta_escrita, os.path.join(self.directorio, "tokenizer.json"))
+        self.assertEqual(os.listdir(self.directorio), ["tokenizer.json"])
+
+    def test_failed_write_leaves_no_file(self):
+        self.tokenizer.backend_tokenizer.save.side_effect = OSError("disco lleno")
+        views.guardar_tokenizer_rapido(self.tokenizer)
+
+        self.assertEqual(os.listdir(self.directorio), [])
+
+
+class OptimizarModeloTests(SimpleTestCase):
+    """Pruebas del modelo trazado con TorchScript que usa la vista de predicción."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        config = AlbertConfig(
+            vocab_size=100,
+            embedding_size=16,
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            intermediate_size=37,
+            max_position_embeddings=views.MAX_LEN,
+            num_labels=2,
+            torchscript=True,
+        )
+        base = AlbertForSequenceClassification(config).to(views.device).eval()
+        self.modelo = views.optimizar_modelo(copy.deepcopy(base))
+        # Mismo modelo sin trazar, con la misma cuantización o precisión que aplica optimizar_modelo
+        if views.device.type == "cuda":
+            self.referencia = base.half()
+        else:
+            self.referencia = torch.quantization.quantize_dynamic(base, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def test_modelo_trazado(self):
+        self.assertIsInstance(self.modelo, torch.jit.ScriptModule)
+
+    def test_lotes_de_distinta_forma(self):
+        """El modelo trazado con forma (1, MAX_LEN) acepta lotes de otro tamaño y longitud."""
+        texto_largo = torch.randint(5, 100, (23,), device=views.device)
+        texto_corto = torch.randint(5, 100, (9,), device=views.device)
+
+        # Lote de dos textos rellenado hasta el más largo, como hace _predecir_lote
+        input_ids = torch.zeros((2, 23), dtype=torch.long, device=views.device)
+        attention_mask = torch.zeros((2, 23), dtype=torch.long, device=views.device)
+        input_ids[0], attention_mask[0] = texto_largo, 1
+        input_ids[1, :9], attention_mask[1, :9] = texto_corto, 1
+        lotes = [
+            (input_ids, attention_mask),
+            (texto_corto.unsqueeze(0), torch.ones((1, 9), dtype=torch.long, device=views.device)),
+        ]
+
+        with torch.inference_mode():
+            for ids, mask in lotes:
+                obtenido = self.modelo(ids, mask)[0]
+                esperado = self.referencia(ids, mask)[0]
+                self.assertEqual(obtenido.shape, (ids.shape[0], 2))
+                self.assertTrue(torch.allclose(obtenido, esperado, atol=1e-4))
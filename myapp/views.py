@@ -1,11 +1,69 @@
 import re
 import torch
 import os
+import tempfile
+import functools
+import hashlib
+import queue
+import threading
+import time
 from django.shortcuts import render, redirect
-from .models import AppUser
-from django.contrib.auth.hashers import make_password
-from django.core.mail import send_mail
-from transformers import AlbertTokenizer, AlbertForSequenceClassification
+from .decorators import require_session_user
+from .models import AppUser, delete_code
+from .tasks import send_verification_email
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+from transformers import AlbertTokenizer, AlbertTokenizerFast, AlbertForSequenceClassification
+
+# Tiempo (en segundos) que se recuerda una contraseña verificada para evitar repetir PBKDF2
+PASSWORD_FAST_CACHE_TTL = 300
+
+@functools.lru_cache(maxsize=None)
+def _dummy_hash():
+    """
+    Hash de relleno, calculado una sola vez con el primer correo desconocido.
+
+    Se verifica contra él cuando el correo no existe, para que esa respuesta tarde
+    lo mismo que una contraseña incorrecta.
+    """
+    return make_password("enumeration-guard")
+
+def _password_fast_key(user, raw_password):
+    """
+    Calcula una huella rápida (HMAC-SHA256) de la contraseña ingresada.
+
+    La clave del HMAC se deriva de `SECRET_KEY`, así que la huella no puede
+    comprobarse sin ella; el hash almacenado va en la sal para que la huella
+    deje de coincidir en cuanto la contraseña cambia.
+    """
+    return salted_hmac(
+        f"myapp.views.password_fast:{user.password}",
+        f"{user.id}:{raw_password or ''}",
+        algorithm="sha256",
+    ).hexdigest()
+
+def _check_password_cached(user, raw_password):
+    """
+    Verifica la contraseña del usuario consultando primero la cache.
+
+    Si la huella rápida coincide con la guardada en Redis se acepta sin ejecutar
+    PBKDF2; en caso contrario se usa `check_password` y, si es correcta, se
+    guarda la huella durante `PASSWORD_FAST_CACHE_TTL` segundos.
+    """
+    cache_key = f"pwfast:{user.id}"
+
+    cached_key = cache.get(cache_key)
+    if cached_key and constant_time_compare(cached_key, _password_fast_key(user, raw_password)):
+        return True
+
+    if not user.check_password(raw_password):
+        return False
+
+    # La huella se calcula después de verificar porque `check_password` puede volver a
+    # encriptar la contraseña y cambiar `user.password`
+    cache.set(cache_key, _password_fast_key(user, raw_password), PASSWORD_FAST_CACHE_TTL)
+    return True
 
 def welcome(request):
     """
@@ -62,36 +120,23 @@ def login_view(request):
         password = request.POST.get("password")
 
         try:
-            user = AppUser.objects.get(email=email)
+            user = AppUser.objects.only('id', 'email', 'first_name', 'password').get(email=email)
         except AppUser.DoesNotExist:
+            check_password(password, _dummy_hash())  # Igualar el tiempo de respuesta
             return render(request, "login.html", {"error": "Correo no registrado."})
 
         # Verificar contraseña
-        if not user.check_password(password):
+        if not _check_password_cached(user, password):
             return render(request, "login.html", {"error": "Contraseña incorrecta."})
 
         # Generar y enviar código de verificación
-        user.generate_verification_code()
-        send_mail(
+        code = user.generate_verification_code()
+        send_verification_email.delay(
+            user.email,
+            user.first_name,
+            code,
             "🔐 Tu código de verificación - NEX",
-            f"""
-            Hola {user.first_name}.
-
-            Hemos recibido una solicitud para acceder a tu cuenta en NEX. 
-            Para completar el inicio de sesión, ingresa el siguiente código de verificación:
-
-            🔑 {user.verification_code}
-
-            Este código es válido por 10 minutos. Si no solicitaste este acceso, puedes ignorar este mensaje.
-
-            Si necesitas ayuda, contáctanos en cancerproyecto0@gmail.com.
-
-            Saludos,  
-            El equipo de NEX
-            """,
-            user.email,  
-            [user.email],
-            fail_silently=False,
+            "login",
         )
 
         # Guardar el email en la sesión temporalmente
@@ -178,12 +223,17 @@ def verify_code(request):
         code = request.POST.get("code")
 
         try:
-            user = AppUser.objects.get(email=email, verification_code=code)
-            request.session["authenticated_user"] = user.email  # Marca al usuario como autenticado
-            return redirect("home")  # Redirige a la página de inicio
+            user = AppUser.objects.only('id', 'email').get(email=email)
         except AppUser.DoesNotExist:
             return render(request, "verify_code.html", {"error": "Código incorrecto."})
 
+        if not user.check_verification_code(code):
+            return render(request, "verify_code.html", {"error": "Código incorrecto."})
+
+        delete_code(user.id)  # El código solo puede usarse una vez
+        request.session["authenticated_user"] = user.email  # Marca al usuario como autenticado
+        return redirect("home")  # Redirige a la página de inicio
+
     return render(request, "verify_code.html")
 
 def forgot_password(request):
@@ -212,30 +262,18 @@ def forgot_password(request):
         email = request.POST.get("email")
 
         try:
-            user = AppUser.objects.get(email=email)
+            user = AppUser.objects.only('id', 'email', 'first_name').get(email=email)
         except AppUser.DoesNotExist:
             return render(request, "forgot_password.html", {"error": "Correo no registrado."})
 
         # Generar y enviar código de verificación
-        user.generate_verification_code()
-        send_mail(
-            "🔐 Recuperación de contraseña - NEX",
-            f"""
-            Hola {user.first_name},
-
-            Has solicitado restablecer tu contraseña en NEX.  
-            Usa el siguiente código para continuar con el proceso:
-
-            🔑 {user.verification_code}
-
-            Si no solicitaste esto, ignora este mensaje.
-
-            Saludos,  
-            El equipo de NEX
-            """,
+        code = user.generate_verification_code()
+        send_verification_email.delay(
             user.email,
-            [user.email],
-            fail_silently=False,
+            user.first_name,
+            code,
+            "🔐 Recuperación de contraseña - NEX",
+            "reset",
         )
 
         request.session["reset_email"] = user.email  # Guardar email temporalmente
@@ -275,12 +313,17 @@ def verify_reset_code(request):
         code = request.POST.get("code")
 
         try:
-            user = AppUser.objects.get(email=email, verification_code=code)
-            request.session["verified_reset"] = True  # Marcar como verificado
-            return redirect("reset_password")  # Redirigir al cambio de contraseña
+            user = AppUser.objects.only('id', 'email').get(email=email)
         except AppUser.DoesNotExist:
             return render(request, "verify_reset_code.html", {"error": "Código incorrecto."})
 
+        if not user.check_verification_code(code):
+            return render(request, "verify_reset_code.html", {"error": "Código incorrecto."})
+
+        delete_code(user.id)  # El código solo puede usarse una vez
+        request.session["verified_reset"] = True  # Marcar como verificado
+        return redirect("reset_password")  # Redirigir al cambio de contraseña
+
     return render(request, "verify_reset_code.html")
 
 def reset_password(request):
@@ -315,10 +358,8 @@ def reset_password(request):
     if request.method == "POST":
         new_password = request.POST.get("password")
 
-        user = AppUser.objects.get(email=email)
-        user.password = make_password(new_password)  # Guardar la nueva contraseña encriptada
-        user.verification_code = None  # Eliminar el código usado
-        user.save()
+        # Guardar la nueva contraseña encriptada con un único UPDATE
+        AppUser.objects.filter(email=email).update(password=make_password(new_password))
 
         # Limpiar sesión
         del request.session["reset_email"]
@@ -348,6 +389,7 @@ def logout_view(request):
     request.session.flush()  # Elimina todas las variables de sesión
     return redirect("login")  # Redirige al login
 
+@require_session_user
 def home(request):
     """
     Vista que muestra la página principal de la aplicación.
@@ -366,11 +408,9 @@ def home(request):
         - Si el usuario está autenticado, renderiza `home.html`.
         - Si no está autenticado, lo redirige a `login`.
     """
-    if not request.session.get("authenticated_user"):
-        return redirect("login")  # Redirigir al login si no está autenticado
-
     return render(request, "home.html")  # Mostrar página principal
 
+@require_session_user
 def historia_clinica(request):
     """_summary_
 
@@ -380,9 +420,6 @@ def historia_clinica(request):
     Returns:
         _type_: _description_
     """
-
-    if not request.session.get("authenticated_user"):
-        return redirect("login")
     return render(request,'historia clinica.html')
 
 
@@ -397,45 +434,182 @@ def historia_clinica(request):
 DIRECTORIO_MODELO = '/modelos/Modelos Entrenados/modelo_cancer_albert' # Cambiado a ALBERT por convención
 MAX_LEN = 256
 
-print("--- Cargando modelo y tokenizador para la web... ---")
+# Cada worker de gunicorn usa un solo hilo de PyTorch para no competir por los núcleos
+# con los demás workers (se puede cambiar con la variable de entorno TORCH_NUM_THREADS).
+NUM_HILOS_TORCH = int(os.getenv("TORCH_NUM_THREADS", "1"))
+torch.set_num_threads(NUM_HILOS_TORCH)
+try:
+    torch.set_num_interop_threads(NUM_HILOS_TORCH)
+except RuntimeError:
+    # Solo puede configurarse una vez y antes de iniciar trabajo en paralelo
+    pass
+torch.backends.mkldnn.enabled = True
+
 # Mantener el uso de 'device' para compatibilidad con Azure
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Variable global para almacenar el modelo y tokenizador cargados.
+# Se cargan de forma diferida con `cargar_modelo()` la primera vez que se necesitan.
 modelo_cargado = None
 tokenizer_cargado = None
+_modelo_inicializado = False
+_modelo_lock = threading.Lock()
 
-try:
-    if not os.path.exists(DIRECTORIO_MODELO):
-        print(f"ERROR: La carpeta del modelo '{DIRECTORIO_MODELO}' no se encontró. Asegúrate de haberla descargado.")
+def optimizar_modelo(modelo):
+    """
+    Prepara el modelo para inferencia y lo convierte a TorchScript.
+
+    En CPU cuantiza las capas lineales a int8 (cuantización dinámica); en GPU
+    convierte los pesos a FP16. Como los lotes tienen tamaño y longitud variables,
+    el modelo trazado se compara con el original sobre un lote de otra forma; si el
+    trazado falla o no coincide, se devuelve el modelo sin trazar.
+    """
+    modelo.eval()
+    if device.type == "cuda":
+        modelo.half()
     else:
-        # 🚨 CAMBIO CLAVE: Reemplazamos BertForSequenceClassification por AlbertForSequenceClassification
-        modelo_cargado = AlbertForSequenceClassification.from_pretrained(DIRECTORIO_MODELO)
-        modelo_cargado.to(device)
-        # 🚨 CAMBIO CLAVE: Reemplazamos BertTokenizer por AlbertTokenizer
-        tokenizer_cargado = AlbertTokenizer.from_pretrained(DIRECTORIO_MODELO)
-        print(f"Modelo y tokenizador cargados exitosamente para la vista web.")
-
-except Exception as e:
-    print(f"Ocurrió un error al cargar el modelo: {e}")
-    modelo_cargado = None
-    tokenizer_cargado = None
+        modelo = torch.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+
+    try:
+        dummy_ids = torch.ones((1, MAX_LEN), dtype=torch.long, device=device)
+        dummy_mask = torch.ones((1, MAX_LEN), dtype=torch.long, device=device)
+        with torch.no_grad():
+            trazado = torch.jit.trace(modelo, (dummy_ids, dummy_mask))
+
+            # Lote de prueba con otro tamaño y otra longitud, con relleno en la segunda fila
+            prueba_ids = torch.full((2, 8), 5, dtype=torch.long, device=device)
+            prueba_mask = torch.ones((2, 8), dtype=torch.long, device=device)
+            prueba_mask[1, 4:] = 0
+            esperado = modelo(prueba_ids, prueba_mask)[0]
+            obtenido = trazado(prueba_ids, prueba_mask)[0]
+        if obtenido.shape != esperado.shape or not torch.allclose(obtenido, esperado, atol=1e-3):
+            print("El modelo trazado no admite lotes de otra forma, se usará sin trazar.")
+            return modelo
+        return trazado
+    except Exception as e:
+        print(f"No se pudo trazar el modelo con TorchScript, se usará sin trazar: {e}")
+        return modelo
+
+def guardar_tokenizer_rapido(tokenizer):
+    """
+    Guarda `tokenizer.json` en la carpeta del modelo si todavía no existe.
+
+    Sin ese archivo, `AlbertTokenizerFast` se construye convirtiendo el modelo de
+    SentencePiece en cada arranque; con él, la carga es directa. Se escribe primero
+    en un archivo temporal y luego se renombra, para que otro proceso que arranque a
+    la vez nunca lea un `tokenizer.json` a medio escribir.
+    """
+    ruta = os.path.join(DIRECTORIO_MODELO, 'tokenizer.json')
+    if os.path.exists(ruta):
+        return
+    try:
+        fd, ruta_temporal = tempfile.mkstemp(dir=DIRECTORIO_MODELO, suffix='.tmp')
+        os.close(fd)
+        try:
+            tokenizer.backend_tokenizer.save(ruta_temporal)
+            os.replace(ruta_temporal, ruta)
+        except Exception:
+            os.remove(ruta_temporal)
+            raise
+    except Exception as e:
+        print(f"No se pudo guardar el tokenizador rápido en '{ruta}': {e}")
+
+def cargar_tokenizer():
+    """
+    Carga el tokenizador del modelo, preferentemente la versión rápida en Rust.
+
+    Convertir `spiece.model` a `AlbertTokenizerFast` requiere `protobuf` y
+    `sentencepiece`; si la conversión falla se usa `AlbertTokenizer`, más lento
+    pero equivalente.
+    """
+    try:
+        tokenizer = AlbertTokenizerFast.from_pretrained(DIRECTORIO_MODELO)
+    except (ImportError, ValueError) as e:
+        print(f"No se pudo cargar AlbertTokenizerFast, se usará AlbertTokenizer: {e}")
+        return AlbertTokenizer.from_pretrained(DIRECTORIO_MODELO)
+    guardar_tokenizer_rapido(tokenizer)
+    return tokenizer
+
+def cargar_modelo():
+    """
+    Carga el modelo y el tokenizador una sola vez por proceso.
+
+    Si gunicorn se inicia con `preload_app`, el proceso maestro llama a esta función
+    antes de crear los workers, que comparten así los pesos del modelo en memoria.
+    En otro caso, el modelo se carga con la primera predicción.
+    """
+    global modelo_cargado, tokenizer_cargado, _modelo_inicializado
+    if _modelo_inicializado:
+        return modelo_cargado, tokenizer_cargado
+
+    with _modelo_lock:
+        if _modelo_inicializado:
+            return modelo_cargado, tokenizer_cargado
+
+        print("--- Cargando modelo y tokenizador para la web... ---")
+        try:
+            if not os.path.exists(DIRECTORIO_MODELO):
+                print(f"ERROR: La carpeta del modelo '{DIRECTORIO_MODELO}' no se encontró. Asegúrate de haberla descargado.")
+            else:
+                # 🚨 CAMBIO CLAVE: Reemplazamos BertTokenizer por AlbertTokenizerFast (implementado en Rust)
+                # Se carga antes que el modelo para no cuantizar ni trazar en vano si falla
+                tokenizer = cargar_tokenizer()
+                # 🚨 CAMBIO CLAVE: Reemplazamos BertForSequenceClassification por AlbertForSequenceClassification
+                # `torchscript=True` hace que el modelo devuelva tuplas para poder trazarlo con TorchScript
+                modelo = AlbertForSequenceClassification.from_pretrained(DIRECTORIO_MODELO, torchscript=True)
+                modelo.to(device)
+                modelo = optimizar_modelo(modelo)
+                modelo_cargado, tokenizer_cargado = modelo, tokenizer
+                print(f"Modelo y tokenizador cargados exitosamente para la vista web.")
+
+        except Exception as e:
+            print(f"Ocurrió un error al cargar el modelo: {e}")
+            modelo_cargado = None
+            tokenizer_cargado = None
+
+        _modelo_inicializado = True
+
+    return modelo_cargado, tokenizer_cargado
 
 # ----------------------------------------------------------------------
 # --- 2. FUNCIÓN DE PREDICCIÓN ---
-# La lógica interna es compatible con ALBERT, por lo que se mantiene igual.
-def predecir_con_modelo_entrenado(texto):
-    if not modelo_cargado or not tokenizer_cargado:
-        return "Error: Modelo no disponible. Revisa los logs del servidor."
+# Las peticiones concurrentes se agrupan en lotes: un hilo en segundo plano junta
+# los textos recibidos durante una ventana corta y ejecuta una sola pasada del modelo.
+TAMANO_MAXIMO_LOTE = 16
+VENTANA_LOTE = 0.01  # Segundos que se espera para juntar más textos en un lote
+TIEMPO_MAXIMO_ESPERA = 5  # Segundos que una petición espera el resultado de su lote
+
+ETIQUETAS = {0: 'Control Sano (CO)', 1: 'Cáncer Colorrectal (CRC)'}
+PREDICCION_CACHE_TTL = 86400  # Segundos que se guarda en cache el resultado de un texto
+
+_cola_predicciones = queue.Queue()
+_hilo_lotes = None
+_hilo_lotes_lock = threading.Lock()
 
-    modelo_cargado.eval()
-    with torch.no_grad():
-        encoding = tokenizer_cargado.encode_plus(
-            texto,
+def iniciar_procesador_lotes():
+    """
+    Inicia el hilo que procesa los lotes de predicción, si no está en ejecución.
+
+    Se llama antes de cada predicción, de modo que cada worker de gunicorn crea su
+    propio hilo después del `fork` (los hilos no sobreviven al `fork`).
+    """
+    global _hilo_lotes
+    with _hilo_lotes_lock:
+        if _hilo_lotes is None or not _hilo_lotes.is_alive():
+            _hilo_lotes = threading.Thread(
+                target=_procesar_lotes, name="prediccion-lotes", daemon=True
+            )
+            _hilo_lotes.start()
+
+def _predecir_lote(textos):
+    """Ejecuta una sola pasada del modelo sobre una lista de textos."""
+    with torch.inference_mode():
+        encoding = tokenizer_cargado(
+            textos,
             add_special_tokens=True,
             max_length=MAX_LEN,
             return_token_type_ids=False,
-            padding='max_length',
+            padding=True,  # Rellena solo hasta el texto más largo del lote
             truncation=True,
             return_attention_mask=True,
             return_tensors='pt',
@@ -443,18 +617,68 @@ def predecir_con_modelo_entrenado(texto):
 
         input_ids = encoding['input_ids'].to(device)
         attention_mask = encoding['attention_mask'].to(device)
-        outputs = modelo_cargado(input_ids=input_ids, attention_mask=attention_mask)
-        _, prediction_id = torch.max(outputs.logits, dim=1)
+        outputs = modelo_cargado(input_ids, attention_mask)
+        _, prediction_ids = torch.max(outputs[0], dim=1)
+
+    return [ETIQUETAS.get(prediction_id, "Categoría Desconocida") for prediction_id in prediction_ids.tolist()]
+
+def _procesar_lotes():
+    """Bucle del hilo en segundo plano: junta textos de la cola y los predice por lotes."""
+    while True:
+        lote = [_cola_predicciones.get()]
+        limite = time.monotonic() + VENTANA_LOTE
+        while len(lote) < TAMANO_MAXIMO_LOTE:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(_cola_predicciones.get(timeout=restante))
+            except queue.Empty:
+                break
 
-    labels = {0: 'Control Sano (CO)', 1: 'Cáncer Colorrectal (CRC)'}
-    return labels.get(prediction_id.item(), "Categoría Desconocida")
+        try:
+            etiquetas = _predecir_lote([texto for texto, _, _ in lote])
+        except Exception as e:
+            print(f"Ocurrió un error al procesar el lote de predicción: {e}")
+            etiquetas = ["Error: No se pudo realizar la predicción."] * len(lote)
+
+        for (_, evento, resultado), etiqueta in zip(lote, etiquetas):
+            resultado.append(etiqueta)
+            evento.set()
+
+def predecir_con_modelo_entrenado(texto):
+    # Los textos repetidos se responden desde la cache sin ejecutar el modelo
+    cache_key = "pred:" + hashlib.sha256(texto.strip().lower().encode()).hexdigest()
+    etiqueta = cache.get(cache_key)
+    if etiqueta is not None:
+        return etiqueta
+
+    modelo, tokenizer = cargar_modelo()
+    if modelo is None or tokenizer is None:
+        return "Error: Modelo no disponible. Revisa los logs del servidor."
+
+    iniciar_procesador_lotes()
+    evento = threading.Event()
+    resultado = []
+    _cola_predicciones.put((texto, evento, resultado))
+
+    if not evento.wait(TIEMPO_MAXIMO_ESPERA):
+        return "Error: La predicción tardó demasiado. Intenta de nuevo."
+
+    etiqueta = resultado[0]
+    if etiqueta in ETIQUETAS.values():
+        cache.set(cache_key, etiqueta, PREDICCION_CACHE_TTL)
+    return etiqueta
 
 # ----------------------------------------------------------------------
 # --- 3. LA VISTA DE DJANGO ---
-# Esta parte se mantiene INTACTA para garantizar la conexión con tu plataforma.
+# Protegida con `require_session_user`: solo la usan usuarios autenticados.
+@require_session_user
 def hacer_prediccion_view(request):
     """
     Maneja las peticiones GET y POST para la página de predicción.
+
+    Los usuarios sin sesión iniciada se redirigen al login.
     """
     # Asumo que 'render' está disponible en el scope (importado de django.shortcuts)
     from django.shortcuts import render 
@@ -0,0 +1,4 @@
+# Carga la aplicación de Celery al iniciar Django para que @shared_task la utilice.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,18 @@
+"""
+Configuración de Celery para el proyecto myproject.
+
+Las tareas en segundo plano (por ejemplo, el envío de correos) se registran
+automáticamente desde el módulo `tasks.py` de cada aplicación instalada.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+
+app = Celery('myproject')
+
+# Toma toda la configuración con prefijo CELERY_ desde settings.py
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -142,6 +142,27 @@ DATABASES = {
 # }
 
 
+# Cache y sesiones
+# Las sesiones se leen desde Redis y solo se consulta la base de datos si no estan en cache.
+
+# Redis compartido por la cache, las sesiones y Celery
+REDIS_URL = os.getenv("REDIS_URL", "unix:///var/run/redis/redis.sock")
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'PARSER_CLASS': 'redis.connection._HiredisParser',
+        },
+    }
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'default'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -161,6 +182,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Hashers de contraseñas: el primero se usa para crear hashes nuevos.
+# Solo puede haber un hasher por algoritmo: Django usa el último registrado con ese nombre,
+# así que FastCPBKDF2Hasher es el único `pbkdf2_sha256` y verifica también los hashes antiguos.
+PASSWORD_HASHERS = [
+    'myapp.hashers.FastCPBKDF2Hasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -197,6 +230,13 @@ EMAIL_USE_SSL = False
 EMAIL_HOST_USER = os.getenv("CORREO")  # Reemplaza con tu correo real
 EMAIL_HOST_PASSWORD =  os.getenv("CONTRASENIA")  # Pega aquí la contraseña de aplicación SIN espacios
 
+# Configuracion de Celery (envio de correos en segundo plano)
+# Por defecto usa el mismo Redis que la cache; Celery nombra "redis+socket://" a los sockets Unix
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL.replace("unix://", "redis+socket://", 1))
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_IGNORE_RESULT = True
+
 # Configuracion acceso a api de google inicio de sesion
 SITE_ID = 1
 SOCIALACCOUNT_PROVIDERS = {
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Comando de inicio de Azure App Service (configurado en el workflow de despliegue).
+#
+# Inicia el worker de Celery que envía los correos de verificación y, en primer plano,
+# el servidor web con gunicorn (que lee su configuración de gunicorn.conf.py).
+# Sin el worker, los correos de inicio de sesión y de recuperación nunca se envían.
+
+celery -A myproject worker --loglevel=info --concurrency=2 &
+
+exec gunicorn --bind=0.0.0.0 --timeout 600 myproject.wsgi